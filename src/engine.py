@@ -1,7 +1,11 @@
 # src/engine.py
-import os, json, time, math, tempfile
+import os, time, math, queue, bisect, tempfile
+import orjson
 from collections import deque, defaultdict
 from datetime import datetime
+from functools import lru_cache
+
+from sortedcontainers import SortedDict
 
 class GridEngine:
     """
@@ -12,6 +16,7 @@ class GridEngine:
     - 後續成交規則：
         * 買單成交 -> 在該買單上方一格掛賣單
         * 賣單成交 -> 在該賣單下方一格掛買單
+    - 成交偵測：優先走 OKX 私有 WebSocket orders 推播；REST 輪詢僅作備援/對帳
     - 保留：價格帶保護、部分成交入賬、原子寫狀態、命令通道
     """
 
@@ -28,41 +33,73 @@ class GridEngine:
         snap_price,          # 函數: snap_price(price) -> price with precision
         state_path: str = "grid_state.json",
         commands_path: str = "grid_commands.jsonl",
+        trades_path: str = "trades.ndjson",
+        equity_path: str = "equity.ndjson",
         fee_rate: float = 0.0005,
         sleep_sec: float = 0.5,
         loop_sleep: float = 2.0,
         band_ttl: float = 8.0,
+        snap_min_interval: float = 1.0,   # 快照最小間隔（即使 dirty 也不寫更快）
+        snap_max_interval: float = 30.0,  # 無變化時的心跳寫入間隔（讓 ts 前進）
         init_position: bool = False,      # <--- 新增：是否啟用初始倉位
+        ws=None,                          # 可選：OkxOrdersWS 私有推播（無則退回 REST 輪詢）
     ):
         self.okx = okx
         self.symbol = symbol
         self.mkt = mkt
         self.entry_price = float(entry_price)
         self.contract_size = float(contract_size)
+
+        # 精度轉換走 ccxt 的字串格式化；熱路徑反覆吃同一批網格價位 -> memoize
+        self._p_prec_cached = lru_cache(maxsize=4096)(
+            lambda p: float(self.okx.price_to_precision(self.symbol, p)))
+        self._q_prec_cached = lru_cache(maxsize=4096)(
+            lambda q: float(self.okx.amount_to_precision(self.symbol, q)))
+
         self.levels = sorted(set(float(self.p_prec(p)) for p in levels))
         self.GRID_QTY_BY_LEVEL = {float(self.p_prec(k)): float(v) for k, v in grid_qty_by_level.items()}
         self.place_limit = place_limit
         self.snap_price = snap_price
+        self.ws = ws
 
         self.STATE_PATH = state_path
         self.COMMANDS_PATH = commands_path
+        self.TRADES_PATH = trades_path
+        self.EQUITY_PATH = equity_path
         self.fee_rate = float(fee_rate)
-        self.SLEEP_SEC = float(sleep_sec)
+        self.SLEEP_SEC = float(sleep_sec)   # 僅作為出錯退避的基準；限速由 ccxt enableRateLimit 處理
         self.LOOP_SLEEP = float(loop_sleep)
+        self._place_err_streak = 0
 
         # 參數：價格帶快取
         self._band_cache = None   # (max_buy, min_sell)
         self._band_ts = 0.0
         self._band_ttl = float(band_ttl)
 
+        # 標記價快取（與價格帶共用 TTL）
+        self._mark_cache = None
+        self._mark_ts = 0.0
+
+        # 快照節流：有變化才重寫，無變化時最多 snap_max_interval 寫一次心跳
+        self.snap_min_interval = float(snap_min_interval)
+        self.snap_max_interval = float(snap_max_interval)
+        self._dirty = True
+        self._last_snap_ts = 0.0
+
         # 運行態
         self.open_orders: dict[float, str] = {}   # price -> order_id
         self.order_meta: dict[str, dict] = {}     # oid -> {price, side, last_filled}
-        self.trades_log = deque(maxlen=5000)
-        self.inventory = deque()  # FIFO lots: {'contracts', 'price'}
+        # 按方向分開的價格有序索引（快照/心跳直接走已排序的 keys，免掃描免排序）
+        self._buy_orders = SortedDict()           # price -> order_id
+        self._sell_orders = SortedDict()          # price -> order_id
+        # 歷史完整落在 ndjson；記憶體只留小環形緩衝供引擎端診斷用
+        self.trades_log = deque(maxlen=50)
+        # 倉位用加權平均成本法記帳（單向網格下淨損益與 FIFO 相同，每筆 O(1)）
+        self._pos_contracts = 0.0
+        self._pos_cost = 0.0      # Σ(price * contracts)
         self.realized_pnl = 0.0
         self.fills_at = defaultdict(lambda: {'buy': 0, 'sell': 0})
-        self.equity_series = deque(maxlen=5000)
+        self.equity_series = deque(maxlen=50)
 
         # 一次性掛滿 初始化控制
         self._initialized_full = False
@@ -70,30 +107,36 @@ class GridEngine:
         # 啟用初始倉位時，首次成交要忽略補單；未啟用則不忽略
         self._first_fill_ignore = bool(init_position)
 
-    # ---------- 精度助手 ----------
+    # ---------- 精度助手（帶快取） ----------
     def p_prec(self, price: float) -> float:
-        return float(self.okx.price_to_precision(self.symbol, price))
+        return self._p_prec_cached(float(price))
 
     def q_prec(self, qty: float) -> float:
-        return float(self.okx.amount_to_precision(self.symbol, qty))
+        return self._q_prec_cached(float(qty))
 
-    # ---------- 鄰格 ----------
+    # ---------- 鄰格（self.levels 已排序，直接二分） ----------
     def neighbor_above(self, p: float):
-        hs = [x for x in self.levels if x > p]
-        return hs[0] if hs else None
+        i = bisect.bisect_right(self.levels, p)
+        return self.levels[i] if i < len(self.levels) else None
 
     def neighbor_below(self, p: float):
-        ls = [x for x in self.levels if x < p]
-        return ls[-1] if ls else None
+        i = bisect.bisect_left(self.levels, p)
+        return self.levels[i - 1] if i > 0 else None
 
     # ---------- 原子寫 JSON ----------
-    def _atomic_write_json(self, path: str, data: dict):
+    def _atomic_write_json(self, path: str, data: dict, fsync: bool = False):
+        # tempfile + rename 保證原子性；fsync 只在真正需要落盤保證時開啟
+        # （監控快照每 2s 重寫一次，掉電丟最後一筆可接受，fsync 反而是整個寫入的大頭）
         dir_ = os.path.dirname(path) or "."
         fd, tmp = tempfile.mkstemp(prefix=".tmp_", dir=dir_)
         try:
-            with os.fdopen(fd, "w") as f:
-                json.dump(data, f, ensure_ascii=False, indent=2)
-                f.flush(); os.fsync(f.fileno())
+            with os.fdopen(fd, "wb") as f:
+                # OPT_NON_STR_KEYS：grid_qty_by_level 以 float 價位作鍵
+                f.write(orjson.dumps(
+                    data,
+                    option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS))
+                if fsync:
+                    f.flush(); os.fsync(f.fileno())
             os.replace(tmp, path)
         finally:
             try:
@@ -101,23 +144,28 @@ class GridEngine:
             except Exception:
                 pass
 
-    # ---------- 當前價格 ----------
+    # ---------- 追加寫 ndjson（trades / equity 增量紀錄） ----------
+    @staticmethod
+    def _append_ndjson(path: str, row: dict):
+        try:
+            with open(path, "ab") as f:
+                f.write(orjson.dumps(row) + b"\n")
+        except Exception as e:
+            print(f"append {path} err: {e}")
+
+    # ---------- 當前價格（帶快取；一個 ticker 搞定，不再退回 order book） ----------
     def current_mark_or_mid(self) -> float:
+        now = time.time()
+        if self._mark_cache and (now - self._mark_ts) < self._band_ttl:
+            return self._mark_cache
         try:
             tk = self.okx.fetch_ticker(self.symbol)
-            try:
-                mark = float(tk['info'].get('markPx'))
-                if mark:
-                    return self.p_prec(mark)
-            except Exception:
-                pass
-            ob = self.okx.fetch_order_book(self.symbol, limit=1)
-            if ob.get('bids') and ob.get('asks'):
-                mid = (ob['bids'][0][0] + ob['asks'][0][0]) / 2.0
-                return self.p_prec(mid)
-            return self.p_prec(float(tk.get('last') or self.entry_price))
+            px = float(tk['info'].get('markPx') or tk.get('last') or self.entry_price)
+            self._mark_cache = self.p_prec(px)
+            self._mark_ts = now
         except Exception:
-            return self.entry_price
+            pass
+        return self._mark_cache or self.entry_price
 
     # ---------- 價格帶（帶快取） ----------
     def fetch_price_band_cached(self, fallback_price: float):
@@ -141,52 +189,101 @@ class GridEngine:
             self._band_ts = now
         return self._band_cache
 
+    # ---------- 掛單登記 / 移除（同步維護方向索引） ----------
+    def _register_order(self, price: float, oid: str, side: str):
+        self.open_orders[price] = oid
+        self.order_meta[oid] = {'price': price, 'side': side, 'last_filled': 0.0}
+        (self._buy_orders if side == 'buy' else self._sell_orders)[price] = oid
+        self._dirty = True
+
+    def _forget_order(self, price: float, oid: str):
+        self.open_orders.pop(price, None)
+        self.order_meta.pop(oid, None)
+        self._buy_orders.pop(price, None)
+        self._sell_orders.pop(price, None)
+        self._dirty = True
+
     # ---------- 下單 / 取消 ----------
-    def safe_place(self, side: str, price: float, qty: float):
+    def safe_place(self, side: str, price: float, qty: float, band=None):
         price = self.p_prec(price)
         qty = self.q_prec(qty)
         if price in self.open_orders:
             return None
-        max_buy_band, min_sell_band = self.fetch_price_band_cached(self.current_mark_or_mid())
+        # 多筆連掛時呼叫端可預取價格帶傳入，避免每張單都打一次行情/價格帶
+        if band is None:
+            band = self.fetch_price_band_cached(self.current_mark_or_mid())
+        max_buy_band, min_sell_band = band
         if side == 'buy' and price > max_buy_band:
             print(f"! skip BUY {price}: > maxBuy {max_buy_band}"); return None
         if side == 'sell' and price < min_sell_band:
             print(f"! skip SELL {price}: < minSell {min_sell_band}"); return None
         try:
             o = self.place_limit(side, price, qty)
-            self.open_orders[price] = o['id']
-            self.order_meta[o['id']] = {'price': price, 'side': side, 'last_filled': 0.0}
+            self._register_order(price, o['id'], side)
             print(f"+ {side}@{price} id={o['id']}")
-            time.sleep(self.SLEEP_SEC)
+            self._place_err_streak = 0
             return o
         except Exception as e:
+            # 限速交給 ccxt enableRateLimit；只在連續出錯時指數退避
             print(f"! place {side}@{price} err: {e}")
-            time.sleep(self.SLEEP_SEC)
+            time.sleep(min(self.SLEEP_SEC * (2 ** self._place_err_streak), 5.0))
+            self._place_err_streak += 1
             return None
 
     def safe_cancel_by_price(self, price: float):
         p = self.p_prec(float(price))
-        oid = self.open_orders.pop(p, None)
+        oid = self.open_orders.get(p)
         if not oid:
             return False
         try:
             self.okx.cancel_order(oid, self.symbol)
         except Exception as e:
             print(f"cancel_order({oid}) err:", e)
-        self.order_meta.pop(oid, None)
+        self._forget_order(p, oid)
         print(f"- canceled order at {p}")
         return True
 
     def cancel_all_open_orders(self):
-        for p, oid in list(self.open_orders.items()):
+        # cancel-batch-orders 一次最多 20 張：N 個 RTT -> ceil(N/20) 個
+        items = list(self.open_orders.items())
+        inst_id = self.mkt['id']
+        for i in range(0, len(items), 20):
+            chunk = items[i:i + 20]
             try:
-                self.okx.cancel_order(oid, self.symbol)
+                self.okx.privatePostTradeCancelBatchOrders(
+                    [{'instId': inst_id, 'ordId': oid} for _, oid in chunk])
             except Exception as e:
-                print(f"cancel_order({oid}) err:", e)
-            self.order_meta.pop(oid, None)
-            self.open_orders.pop(p, None)
+                print(f"cancel-batch-orders err: {e}")
+                for p, oid in chunk:
+                    try:
+                        self.okx.cancel_order(oid, self.symbol)
+                    except Exception as e2:
+                        print(f"cancel_order({oid}) err:", e2)
+            for p, oid in chunk:
+                self._forget_order(p, oid)
         print("- canceled ALL open orders")
 
+    def _batch_place(self, orders: list[tuple[str, float, float]]):
+        """批次掛單（trade/batch-orders，一次最多 20 張），逐筆登記成功的委託。"""
+        inst_id = self.mkt['id']
+        for i in range(0, len(orders), 20):
+            chunk = orders[i:i + 20]
+            payload = [{
+                'instId': inst_id,
+                'tdMode': 'cross',
+                'side': side,
+                'ordType': 'limit',
+                'px': self.okx.price_to_precision(self.symbol, price),
+                'sz': self.okx.amount_to_precision(self.symbol, qty),
+            } for side, price, qty in chunk]
+            res = self.okx.privatePostTradeBatchOrders(payload)
+            for (side, price, qty), row in zip(chunk, res.get('data', [])):
+                if row.get('sCode') == '0' and row.get('ordId'):
+                    self._register_order(price, row['ordId'], side)
+                    print(f"+ {side}@{price} id={row['ordId']}")
+                else:
+                    print(f"! batch place {side}@{price} rejected: {row.get('sMsg')}")
+
     # ---------- 市價開倉（初始倉位） ----------
     def _place_market(self, side: str, qty_contracts: float):
         """簡單市價單，用於初始倉位；需要時可擴展參數（如 reduceOnly、postOnly 不適用市價）。"""
@@ -201,25 +298,29 @@ class GridEngine:
 
     # ---------- 成交記帳 ----------
     def on_fill(self, side: str, price: float, contracts: float):
-        ts = datetime.utcnow().isoformat() + "Z"
-        self.trades_log.append({'ts': ts, 'side': side, 'price': price, 'contracts': contracts})
+        self._dirty = True
+        # 紀錄列用 epoch 毫秒：pandas 讀整數比解析 ISO 字串快一個量級，行也更短
+        ts = int(time.time() * 1000)
+        trade = {'ts': ts, 'side': side, 'price': price, 'contracts': contracts}
+        self.trades_log.append(trade)
+        self._append_ndjson(self.TRADES_PATH, trade)
         self.fills_at[price][side] += 1
 
         if side == 'buy':
-            self.inventory.append({'contracts': contracts, 'price': price})
+            self._pos_cost += price * contracts
+            self._pos_contracts += contracts
         else:  # sell
-            to_sell = contracts
-            while to_sell > 1e-12 and self.inventory:
-                lot = self.inventory[0]
-                use = min(to_sell, lot['contracts'])
-                pnl = (price - lot['price']) * (use * self.contract_size)
-                fees = self.fee_rate * price * (use * self.contract_size) \
-                     + self.fee_rate * lot['price'] * (use * self.contract_size)
+            use = min(contracts, self._pos_contracts)
+            if use > 1e-12:
+                avg = self._pos_cost / self._pos_contracts
+                pnl = (price - avg) * (use * self.contract_size)
+                fees = self.fee_rate * (price + avg) * (use * self.contract_size)
                 self.realized_pnl += (pnl - fees)
-                lot['contracts'] -= use
-                to_sell -= use
-                if lot['contracts'] <= 1e-12:
-                    self.inventory.popleft()
+                self._pos_cost -= avg * use
+                self._pos_contracts -= use
+                if self._pos_contracts <= 1e-12:
+                    self._pos_contracts = 0.0
+                    self._pos_cost = 0.0
 
     # ---------- 成交後補單（符合你描述的規則） ----------
     def handle_post_close(self, side: str, price: float, filled_contracts: float):
@@ -252,14 +353,23 @@ class GridEngine:
     # ---------- 命令處理（保留） ----------
     def process_commands(self):
         try:
-            if not os.path.exists(self.COMMANDS_PATH):
+            # 先 rename 再讀：對寫端（Streamlit append）是原子交接，
+            # 不會像「讀完再 truncate」那樣在兩步之間丟掉新寫入的指令。
+            # 「沒有指令」是常態，rename 直接吃 FileNotFoundError，
+            # 一次 syscall 就出場，不再先 exists() 探測
+            proc = self.COMMANDS_PATH + ".proc"
+            try:
+                os.rename(self.COMMANDS_PATH, proc)
+            except FileNotFoundError:
                 return
-            with open(self.COMMANDS_PATH, "r") as f:
+            with open(proc, "r") as f:
                 lines = [ln.strip() for ln in f if ln.strip()]
-            open(self.COMMANDS_PATH, "w").close()
+            os.remove(proc)
+            if not lines:
+                return
             for ln in lines:
                 try:
-                    cmd = json.loads(ln)
+                    cmd = orjson.loads(ln)
                 except Exception:
                     continue
                 op = cmd.get("op")
@@ -279,7 +389,7 @@ class GridEngine:
                         if price in self.open_orders:
                             print(f"! skip place_limit: already have order at {price}"); continue
                         o = self.okx.create_order(self.symbol, 'limit', side, cts, price, params)
-                        self.open_orders[price] = o['id']; self.order_meta[o['id']] = {'price': price, 'side': side, 'last_filled': 0.0}
+                        self._register_order(price, o['id'], side)
                         print(f"[cmd] + {side}@{price} id={o['id']}")
                     except Exception as e:
                         print(f"[cmd] place_limit error: {e}")
@@ -308,28 +418,32 @@ class GridEngine:
 
     # ---------- 快照/估值 ----------
     def snapshot_and_dump(self):
+        # 節流：沒有變化就不重新序列化；無變化時仍每 snap_max_interval 寫一次心跳
+        now = time.time()
+        age = now - self._last_snap_ts
+        if age < self.snap_min_interval:
+            return
+        if not self._dirty and age < self.snap_max_interval:
+            return
+
         px = self.current_mark_or_mid()
-        unreal = 0.0; total_contracts = 0.0; cost_notional = 0.0
-        for lot in self.inventory:
-            c = lot['contracts']
-            total_contracts += c
-            cost_notional += lot['price'] * (c * self.contract_size)
-            unreal += (px - lot['price']) * (c * self.contract_size)
-        avg_cost = (cost_notional / (total_contracts * self.contract_size)) if total_contracts > 1e-12 else 0.0
+        total_contracts = self._pos_contracts
+        avg_cost = (self._pos_cost / total_contracts) if total_contracts > 1e-12 else 0.0
+        unreal = (px - avg_cost) * (total_contracts * self.contract_size)
         equity = self.realized_pnl + unreal
 
-        self.equity_series.append({
-            'ts': datetime.utcnow().isoformat() + 'Z',
+        eq_row = {
+            'ts': int(now * 1000),  # epoch 毫秒，讀端免解析 ISO 字串
             'equity': equity,
             'realized': self.realized_pnl,
             'unrealized': unreal,
-        })
+        }
+        self.equity_series.append(eq_row)
+        self._append_ndjson(self.EQUITY_PATH, eq_row)
 
-        open_list = []
-        for p, oid in self.open_orders.items():
-            meta = self.order_meta.get(oid, {})
-            open_list.append({'price': p, 'id': oid, 'side': meta.get('side', '?')})
-        open_list.sort(key=lambda x: x['price'])
+        # 方向索引本身就按價格有序，免 meta 查表也免排序
+        open_list = [{'price': p, 'id': oid, 'side': 'buy'} for p, oid in self._buy_orders.items()] \
+                  + [{'price': p, 'id': oid, 'side': 'sell'} for p, oid in self._sell_orders.items()]
 
         max_buy_band, min_sell_band = self.fetch_price_band_cached(px)
 
@@ -351,17 +465,53 @@ class GridEngine:
             'equity': equity,
             'fee_rate': self.fee_rate,
             'price_band': {'max_buy': max_buy_band, 'min_sell': min_sell_band},
-            'trades': list(self.trades_log)[-300:],
-            'equity_series': list(self.equity_series)[-2000:],
+            # trades / equity 改為增量追加到 ndjson，快照只留可變純量 + 掛單
         }
         self._atomic_write_json(self.STATE_PATH, state)
+        self._dirty = False
+        self._last_snap_ts = now
+
+    # ---------- WebSocket 成交推播 ----------
+    def _handle_order_push(self, row: dict):
+        """處理一筆 orders 頻道推播：增量入帳 + 完結後補單。"""
+        oid = row.get('ordId')
+        meta = self.order_meta.get(oid)
+        if meta is None:
+            return
+        p = meta['price']; side = meta['side']
+        try:
+            acc = float(row.get('accFillSz') or 0.0)
+        except (TypeError, ValueError):
+            acc = 0.0
+        inc = acc - float(meta.get('last_filled', 0.0))
+        if inc > 0:
+            self.on_fill(side, p, inc)
+            meta['last_filled'] = acc
+
+        state = row.get('state')
+        if state == 'filled':
+            self._forget_order(p, oid)
+            self.handle_post_close(side, p, acc)
+        elif state == 'canceled':
+            self._forget_order(p, oid)
+
+    def _drain_ws_events(self):
+        while True:
+            try:
+                row = self.ws.events.get_nowait()
+            except queue.Empty:
+                return
+            self._handle_order_push(row)
 
-    # ---------- 輪詢成交（支持部分成交） ----------
+    # ---------- 輪詢成交（支持部分成交；WS 模式下僅作重連對帳） ----------
     def poll_and_handle_fills(self):
+        # 屬性查找提到迴圈外；meta 已在手上，直接改，不再回頭查 order_meta[oid]
+        fetch_order = self.okx.fetch_order
+        symbol = self.symbol
         for oid, meta in list(self.order_meta.items()):
             p = meta['price']; side = meta['side']
             try:
-                od = self.okx.fetch_order(oid, self.symbol)
+                od = fetch_order(oid, symbol)
             except Exception:
                 continue
 
@@ -372,13 +522,12 @@ class GridEngine:
             # 1) 增量部分先入帳
             if inc > 0:
                 self.on_fill(side, p, inc)
-                self.order_meta[oid]['last_filled'] = filled
+                meta['last_filled'] = filled
 
             st = (od.get('status') or '').lower()
             # 2) 完結後執行補單邏輯
             if st == 'closed':
-                self.open_orders.pop(p, None)
-                self.order_meta.pop(oid, None)
+                self._forget_order(p, oid)
                 self.handle_post_close(side, p, filled)
 
     # ---------- 一次性掛滿 + 可選初始倉位 ----------
@@ -386,24 +535,38 @@ class GridEngine:
         if self._initialized_full:
             return
         px = self.current_mark_or_mid()
+        max_buy_band, min_sell_band = self.fetch_price_band_cached(px)
 
         # 1) 一次性掛滿：px 以下掛買，px 以上掛賣；等於 px 的層跳過
-        sell_total_contracts = 0.0
+        to_place = []
         for p in self.levels:
             qty = self.GRID_QTY_BY_LEVEL.get(p, 0.0)
-            if qty <= 0:
+            if qty <= 0 or p in self.open_orders:
                 continue
             if p > px:
                 # 上方 -> 賣單
-                if self.safe_place('sell', p, qty):
-                    sell_total_contracts += qty
+                if p < min_sell_band:
+                    print(f"! skip SELL {p}: < minSell {min_sell_band}"); continue
+                to_place.append(('sell', p, qty))
             elif p < px:
                 # 下方 -> 買單
-                self.safe_place('buy', p, qty)
+                if p > max_buy_band:
+                    print(f"! skip BUY {p}: > maxBuy {max_buy_band}"); continue
+                to_place.append(('buy', p, qty))
             else:
                 # p == px：跳過不掛，以避免尷尬位置
                 pass
 
+        try:
+            self._batch_place(to_place)
+        except Exception as e:
+            # 批次失敗（權限/網路等）-> 退回逐張掛
+            print(f"! batch place failed, fallback to per-order: {e}")
+            for side, p, qty in to_place:
+                self.safe_place(side, p, qty, band=(max_buy_band, min_sell_band))
+
+        sell_total_contracts = sum(self.GRID_QTY_BY_LEVEL.get(p, 0.0) for p in self._sell_orders)
+
         # 2) 初始倉位：市價買入 = 所有已掛賣單數量之和（可選）
         if self._init_position_enabled and sell_total_contracts > 0:
             self._place_market('buy', sell_total_contracts)
@@ -416,24 +579,46 @@ class GridEngine:
     def run_forever(self, heartbeat_every: int = 20):
         loop_i = 0
         print("Grid engine (traditional full placement) started. Ctrl+C to stop.")
+        if self.ws is not None:
+            self.ws.start()
         try:
+            # 以單調時鐘定節拍：週期 = LOOP_SLEEP，不再是 LOOP_SLEEP + 工作時間
+            next_t = time.monotonic()
             while True:
                 loop_i += 1
+                next_t += self.LOOP_SLEEP
 
                 # 初始化一次性掛滿 + 可選初始倉位
                 if not self._initialized_full:
                     self._initialize_full_grid_once()
 
                 self.process_commands()
-                self.poll_and_handle_fills()
+                if self.ws is not None:
+                    # 重連/首次訂閱後先 REST 對帳一次，再消化推播
+                    if self.ws.resync_needed.is_set():
+                        self.ws.resync_needed.clear()
+                        self.poll_and_handle_fills()
+                    self._drain_ws_events()
+                else:
+                    self.poll_and_handle_fills()
                 self.snapshot_and_dump()
 
                 if heartbeat_every and (loop_i % heartbeat_every == 0):
-                    buys = sum(1 for pr, oid in self.open_orders.items() if self.order_meta.get(oid,{}).get('side')=='buy')
-                    sells = sum(1 for pr, oid in self.open_orders.items() if self.order_meta.get(oid,{}).get('side')=='sell')
-                    inv_c = sum(l['contracts'] for l in self.inventory)
+                    # 方向索引常駐維護，心跳只取長度，不再掃描 open_orders
+                    buys = len(self._buy_orders)
+                    sells = len(self._sell_orders)
+                    inv_c = self._pos_contracts
                     print(f"[{loop_i}] open: buy={buys}, sell={sells}, inv={inv_c:.4f}c, "
                           f"PnL(real={self.realized_pnl:.2f})")
-                time.sleep(self.LOOP_SLEEP)
+
+                dt = next_t - time.monotonic()
+                if dt > 0:
+                    time.sleep(dt)
+                else:
+                    # 這一圈做超時了 -> 重設基準，不追趕積欠的節拍
+                    next_t = time.monotonic()
         except KeyboardInterrupt:
             print("Engine stopped.")
+        finally:
+            if self.ws is not None:
+                self.ws.stop()
@@ -0,0 +1,136 @@
+# src/exchange/okx_ws.py
+import base64
+import hashlib
+import hmac
+import json
+import queue
+import threading
+import time
+
+import websocket  # websocket-client
+
+OKX_WS_PRIVATE = "wss://ws.okx.com:8443/v5/private"
+OKX_WS_PRIVATE_DEMO = "wss://wspap.okx.com:8443/v5/private?brokerId=9999"
+
+
+class OkxOrdersWS:
+    """
+    OKX 私有 WebSocket orders 頻道（推播成交，取代逐單 REST 輪詢）
+    - 背景執行緒跑 WebSocketApp：login -> subscribe orders
+    - 每筆訂單更新放進 events queue，由引擎主循環取出處理
+    - 斷線自動重連（指數退避）；重連/首次訂閱成功後設 resync_needed，
+      讓引擎用 REST fetch_order 對帳一次，補上斷線期間漏掉的成交
+    """
+
+    def __init__(self, api_key: str, api_secret: str, passphrase: str,
+                 inst_id: str, inst_type: str = "SWAP",
+                 use_testnet: bool = False, ping_interval: float = 20.0):
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.passphrase = passphrase
+        self.inst_id = inst_id
+        self.inst_type = inst_type
+        self.url = OKX_WS_PRIVATE_DEMO if use_testnet else OKX_WS_PRIVATE
+        self.ping_interval = float(ping_interval)
+
+        self.events: "queue.Queue[dict]" = queue.Queue()
+        self.resync_needed = threading.Event()
+        self._stop = threading.Event()
+        self._ws = None
+        self._thread = None
+
+    # ---------- 簽名 ----------
+    def _sign(self, ts: str) -> str:
+        msg = ts + "GET" + "/users/self/verify"
+        mac = hmac.new(self.api_secret.encode(), msg.encode(), hashlib.sha256)
+        return base64.b64encode(mac.digest()).decode()
+
+    # ---------- WebSocketApp callbacks ----------
+    def _on_open(self, ws):
+        ts = str(time.time())
+        ws.send(json.dumps({
+            "op": "login",
+            "args": [{
+                "apiKey": self.api_key,
+                "passphrase": self.passphrase,
+                "timestamp": ts,
+                "sign": self._sign(ts),
+            }],
+        }))
+
+    def _on_message(self, ws, raw):
+        if raw == "pong":
+            return
+        try:
+            msg = json.loads(raw)
+        except Exception:
+            return
+
+        event = msg.get("event")
+        if event == "login":
+            if msg.get("code") == "0":
+                ws.send(json.dumps({
+                    "op": "subscribe",
+                    "args": [{
+                        "channel": "orders",
+                        "instType": self.inst_type,
+                        "instId": self.inst_id,
+                    }],
+                }))
+            else:
+                print(f"! ws login failed: {msg}")
+            return
+        if event == "subscribe":
+            # 訂閱成功（含重連後）-> 讓引擎對帳一次，補漏
+            self.resync_needed.set()
+            return
+        if event == "error":
+            print(f"! ws error: {msg}")
+            return
+
+        if (msg.get("arg") or {}).get("channel") == "orders":
+            for row in msg.get("data", []):
+                self.events.put(row)
+
+    def _on_error(self, ws, err):
+        print(f"! ws connection error: {err}")
+
+    def _on_close(self, ws, code, reason):
+        self.resync_needed.set()
+
+    # ---------- 連線循環 ----------
+    def _run(self):
+        backoff = 1.0
+        while not self._stop.is_set():
+            self._ws = websocket.WebSocketApp(
+                self.url,
+                on_open=self._on_open,
+                on_message=self._on_message,
+                on_error=self._on_error,
+                on_close=self._on_close,
+            )
+            try:
+                self._ws.run_forever(ping_interval=self.ping_interval,
+                                     ping_payload="ping")
+            except Exception as e:
+                print(f"! ws run_forever err: {e}")
+            if self._stop.is_set():
+                break
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 30.0)
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, daemon=True,
+                                        name="okx-orders-ws")
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        try:
+            if self._ws:
+                self._ws.close()
+        except Exception:
+            pass
@@ -1,8 +1,10 @@
 # src/main.py
 import os, argparse, math
+import numpy as np
 from dotenv import load_dotenv
 from src.config.loader import load_config
 from src.exchange.okx_client import build_okx
+from src.exchange.okx_ws import OkxOrdersWS
 from src.engine import GridEngine
 
 def parse_args():
@@ -12,11 +14,9 @@ def parse_args():
 
 def make_levels(lower: float, upper: float, levels: int, snap_price):
     if levels <= 1:
-        return [snap_price(lower), snap_price(upper)]
-    step = (upper - lower) / (levels - 1)
-    arr = [snap_price(lower + i * step) for i in range(levels)]
-    arr = sorted(set(arr))
-    return arr
+        return sorted({snap_price(lower), snap_price(upper)})
+    raw = np.linspace(lower, upper, levels)
+    return sorted({snap_price(float(p)) for p in raw})
 
 def main():
     load_dotenv(override=True)
@@ -50,14 +50,12 @@ def main():
 
     levels = make_levels(lower, upper, nlev, snap_price)
 
-    # 用名义金额换算合约数量（近似：qty = 名义/价格/contract_size）
-    # 也可以在配置里直接给每格合约数量，这里给默认策略
-    grid_qty_by_level = {}
+    # 用名义金额换算合约数量（近似：qty = 名义/价格/contract_size），一次向量化算完
+    # 数量精度留给 engine.safe_place 再校正
     mid = (lower + upper) / 2.0
-    for p in levels:
-        contracts = max(0.0, order_size / max(p, 1e-9) / contract_size)
-        # 数量精度留给 engine.safe_place 再校正
-        grid_qty_by_level[p] = contracts
+    arr = np.asarray(levels, dtype=np.float64)
+    qtys = order_size / np.maximum(arr, 1e-9) / contract_size
+    grid_qty_by_level = dict(zip(levels, qtys.tolist()))
 
     # 进场参考价（可用 mid 或当前 mark）
     # 这里用 ticker 的近似，engine 内部会进一步获取
@@ -72,6 +70,13 @@ def main():
         params = {'tdMode': 'cross'}
         return okx.create_order(symbol, 'limit', side, qty, price, params)
 
+    # 私有 WebSocket orders 推播（可用 runtime.use_ws 關閉，關閉則退回 REST 輪詢）
+    ws = None
+    if bool((cfg.get("runtime") or {}).get("use_ws", True)) and api_key and api_secret and passphrase:
+        ws = OkxOrdersWS(api_key, api_secret, passphrase,
+                         inst_id=mkt["id"], inst_type=default_type.upper(),
+                         use_testnet=use_testnet)
+
     engine = GridEngine(
         okx=okx,
         symbol=symbol,
@@ -84,11 +89,16 @@ def main():
         snap_price=snap_price,
         state_path=(cfg.get("runtime") or {}).get("state_path", "grid_state.json"),
         commands_path=(cfg.get("runtime") or {}).get("commands_path", "grid_commands.jsonl"),
+        trades_path=(cfg.get("runtime") or {}).get("trades_path", "trades.ndjson"),
+        equity_path=(cfg.get("runtime") or {}).get("equity_path", "equity.ndjson"),
         fee_rate=float((cfg.get("runtime") or {}).get("fee_rate", 0.0005)),
         sleep_sec=float((cfg.get("runtime") or {}).get("sleep_sec", 0.5)),
         loop_sleep=float((cfg.get("runtime") or {}).get("rest_poll_sec", 2.0)),
         band_ttl=float((cfg.get("runtime") or {}).get("band_ttl", 8.0)),
+        snap_min_interval=float((cfg.get("runtime") or {}).get("snap_min_interval", 1.0)),
+        snap_max_interval=float((cfg.get("runtime") or {}).get("snap_max_interval", 30.0)),
         init_position=bool((cfg.get("grid") or {}).get("init_position", False)),
+        ws=ws,
     )
 
     engine.run_forever(heartbeat_every=int((cfg.get("runtime") or {}).get("ws_heartbeat_sec", 20)))
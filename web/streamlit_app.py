@@ -1,12 +1,14 @@
 # web/streamlit_app.py
 import streamlit as st
 import json, os
+import orjson
 import plotly.graph_objects as go
 from datetime import datetime
 import pandas as pd
 
 STATE_PATH = "grid_state.json"
 COMMANDS_PATH = "grid_commands.jsonl"
+EQUITY_PATH = "equity.ndjson"
 
 import streamlit as st
 
@@ -41,13 +43,34 @@ st.title("📊 OKX Grid Trading – Monitor & Control")
 setup_autorefresh(10, "refresh")
 
 
-# --- 載入狀態檔 ---
+# --- 載入狀態檔（以 mtime 當快取鍵：engine 沒寫新檔就不重新解析） ---
+@st.cache_data(show_spinner=False)
+def _read_state(path: str, mtime: float):
+    with open(path, "rb") as f:
+        return orjson.loads(f.read())
+
 def load_state(path=STATE_PATH):
-    if not os.path.exists(path) or os.path.getsize(path) == 0:
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
         return None
     try:
-        with open(path, "r") as f:
-            return json.load(f)
+        return _read_state(path, mtime)
+    except Exception:
+        return None
+
+# --- 載入 Equity 增量紀錄（engine 逐行追加的 ndjson，只取尾端；同樣按 mtime 快取） ---
+@st.cache_data(show_spinner=False)
+def _read_equity(path: str, mtime: float, tail: int):
+    return pd.read_json(path, lines=True).tail(tail)
+
+def load_equity(path=EQUITY_PATH, tail=2000):
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    try:
+        return _read_equity(path, mtime, tail)
     except Exception:
         return None
 
@@ -76,29 +99,27 @@ fig.add_trace(go.Scatter(
     marker=dict(size=10, symbol="x")
 ))
 
-# 買單線
-for o in state.get('open_orders', []):
-    if o.get('side') == 'buy':
-        fig.add_hline(y=o['price'], line=dict(dash="dot"), annotation_text="BUY", annotation_position="right")
-
-# 賣單線
-for o in state.get('open_orders', []):
-    if o.get('side') == 'sell':
-        fig.add_hline(y=o['price'], line=dict(dash="dot"), annotation_text="SELL", annotation_position="right")
-
-fig.update_layout(height=400, xaxis_title="Time", yaxis_title="Price", showlegend=False)
+# 掛單線：一次性塞進 layout.shapes（逐條 add_hline 每次都重建 layout，N 條就是 N 次）
+# 綠=買單、紅=賣單
+shapes = [
+    dict(type="line", xref="paper", x0=0, x1=1, y0=o['price'], y1=o['price'],
+         line=dict(dash="dot", width=1,
+                   color="green" if o.get('side') == 'buy' else "red"))
+    for o in state.get('open_orders', [])
+]
+
+fig.update_layout(height=400, xaxis_title="Time", yaxis_title="Price",
+                  showlegend=False, shapes=shapes)
 st.plotly_chart(fig, use_container_width=True)
 
 # --- Equity 曲線（支援時間粒度切換） ---
 st.subheader("💰 Equity Curve")
 
-equity_series = state.get("equity_series", [])
+df = load_equity()
 
-if equity_series:
-    # 轉成 DataFrame
-    df = pd.DataFrame(equity_series)
-    # 時間處理（ISO 8601，末尾 Z → UTC）
-    df['ts'] = pd.to_datetime(df['ts'], utc=True, errors='coerce')
+if df is not None and not df.empty:
+    # 時間處理（engine 寫的是 epoch 毫秒，整數轉換遠快於 ISO 解析）
+    df['ts'] = pd.to_datetime(df['ts'], unit='ms', utc=True, errors='coerce')
     df = df.dropna(subset=['ts']).set_index('ts').sort_index()
 
     # 粒度選擇